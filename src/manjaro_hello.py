@@ -1,21 +1,64 @@
 #!/usr/bin/env python3
 
-import collections
-import glob
-import urllib.request
+import functools
 import gettext
 import gi
 import json
 import locale
 import logging
 import os
-import subprocess
+import stat
 import sys
-import webbrowser
 
 gi.require_version("Gtk", "3.0")
 from gi.repository import Gtk, GdkPixbuf
 
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(content):
+        return json.dumps(content, separators=(",", ":")).encode()
+
+_HOME = os.path.expanduser("~")
+
+# Translatable properties of widgets, by property name
+_LOCALE_ELTS = (
+    ("comments", ("aboutdialog",)),
+    ("label", (
+        "autostartlabel",
+        "development",
+        "chat",
+        "donate",
+        "firstcategory",
+        "forum",
+        "install",
+        "installlabel",
+        "involved",
+        "mailling",
+        "readme",
+        "release",
+        "secondcategory",
+        "thirdcategory",
+        "welcomelabel",
+        "welcometitle",
+        "wiki"
+    )),
+    ("tooltip_text", (
+        "about",
+        "home",
+        "development",
+        "chat",
+        "donate",
+        "forum",
+        "mailling",
+        "wiki"
+    ))
+)
+
 
 class EmbedManager:
     """manage included applications"""
@@ -112,6 +155,7 @@ class Hello(Gtk.Window):
         self.save = read_json(self.preferences["save_path"])
         if not self.save:
             self.save = {"locale": None}
+        self._save_dirty = False
 
         # Init window
         self.builder = Gtk.Builder.new_from_file(self.preferences["ui_path"])
@@ -122,27 +166,36 @@ class Hello(Gtk.Window):
         self.builder.get_object("headerbar").props.subtitle = ' '.join(get_lsb_infos())
 
         # Load images
-        if os.path.isfile(self.preferences["logo_path"]):
-            logo = GdkPixbuf.Pixbuf.new_from_file(self.preferences["logo_path"])
+        if _isfile(_stat_or_none(self.preferences["logo_path"])):
+            logo = load_pixbuf(self.preferences["logo_path"], 128)
             self.window.set_icon(logo)
             self.builder.get_object("distriblogo").set_from_pixbuf(logo)
             self.builder.get_object("aboutdialog").set_logo(logo)
 
-        for btn in self.builder.get_object("social").get_children():
-            icon_path = self.preferences["data_path"] + "img/" + btn.get_name() + ".png"
-            self.builder.get_object(btn.get_name()).set_from_file(icon_path)
+        try:
+            with os.scandir(self.preferences["data_path"] + "img/") as entries:
+                images = {entry.name: entry.path for entry in entries if entry.is_file()}
+        except OSError:
+            images = {}
 
-        for widget in self.builder.get_object("homepage").get_children():
-            if isinstance(widget, Gtk.Button) and \
-                    widget.get_image_position() is Gtk.PositionType.RIGHT:
-                img = Gtk.Image.new_from_file(
-                    self.preferences["data_path"] + "img/external-link.png")
-                img.set_margin_start(2)
-                widget.set_image(img)
+        for btn in self.builder.get_object("social").get_children():
+            icon_path = images.get(btn.get_name() + ".png")
+            if icon_path:
+                self.builder.get_object(btn.get_name()).set_from_file(icon_path)
+
+        if "external-link.png" in images:
+            ext_pixbuf = load_pixbuf(images["external-link.png"], 16)
+            for widget in self.builder.get_object("homepage").get_children():
+                if isinstance(widget, Gtk.Button) and \
+                        widget.get_image_position() is Gtk.PositionType.RIGHT:
+                    img = Gtk.Image.new_from_pixbuf(ext_pixbuf)
+                    img.set_margin_start(2)
+                    widget.set_image(img)
 
         # Create pages
-        self.pages = os.listdir("{}/pages/{}".format(self.preferences["data_path"],
-                                                     self.preferences["default_locale"]))
+        self._page_cache = {}
+        self._page_set_locale = {}
+        self.pages = sorted(self.get_page_set(self.preferences["default_locale"]))
         for page in self.pages:
             scrolled_window = Gtk.ScrolledWindow()
             viewport = Gtk.Viewport(border_width=10)
@@ -153,17 +206,24 @@ class Hello(Gtk.Window):
             self.builder.get_object("stack").add_named(scrolled_window, page + "page")
 
         # Init translation
-        self.default_texts = {}
+        self._locale_widgets = []
+        for method, elts in _LOCALE_ELTS:
+            for elt in elts:
+                obj = self.builder.get_object(elt)
+                self._locale_widgets.append(
+                    (getattr(obj, "set_" + method), getattr(obj, "get_" + method)()))
         gettext.bindtextdomain(self.app, self.preferences["locale_path"])
         gettext.textdomain(self.app)
         self.builder.get_object("languages").set_active_id(self.get_best_locale())
 
         # Set autostart switcher state
-        self.autostart = os.path.isfile(fix_path(self.preferences["autostart_path"]))
+        autostart_path = fix_path(self.preferences["autostart_path"])
+        self.autostart = _isfile(_stat_or_none(autostart_path))
         self.builder.get_object("autostart").set_active(self.autostart)
 
         # Live systems
-        if os.path.exists(self.preferences["live_path"]) and os.path.isfile(self.preferences["installer_path"]):
+        if _stat_or_none(self.preferences["live_path"]) is not None and \
+                _isfile(_stat_or_none(self.preferences["installer_path"])):
             self.builder.get_object("installlabel").set_visible(True)
             self.builder.get_object("install").set_visible(True)
         # Installed systems
@@ -179,25 +239,35 @@ class Hello(Gtk.Window):
         :return: locale to use
         :rtype: str
         """
-        path = self.preferences["locale_path"] + "{}/LC_MESSAGES/" + self.app + ".mo"
-        if os.path.isfile(path.format(self.save["locale"])):
+        if self.has_translation(self.save["locale"]):
             return self.save["locale"]
         elif self.save["locale"] == self.preferences["default_locale"]:
             return self.preferences["default_locale"]
         else:
             sys_locale = locale.getdefaultlocale()[0]
             # If user's locale is supported
-            if os.path.isfile(path.format(sys_locale)):
+            if self.has_translation(sys_locale):
                 if "_" in sys_locale:
                     return sys_locale.replace("_", "-")
                 else:
                     return sys_locale
             # If two first letters of user's locale is supported (ex: en_US -> en)
-            elif os.path.isfile(path.format(sys_locale[:2])):
+            elif self.has_translation(sys_locale[:2]):
                 return sys_locale[:2]
             else:
                 return self.preferences["default_locale"]
 
+    def has_translation(self, use_locale):
+        """Tell if a compiled translation of app exists for a locale.
+        :param use_locale: locale to check
+        :type use_locale: str
+        :rtype: bool
+        """
+        if use_locale not in get_locale_dirs(self.preferences["locale_path"]):
+            return False
+        path = "{}{}/LC_MESSAGES/{}.mo".format(self.preferences["locale_path"], use_locale, self.app)
+        return _isfile(_stat_or_none(path))
+
     def set_locale(self, use_locale):
         """Set locale of ui and pages.
         :param use_locale: locale to use
@@ -210,50 +280,13 @@ class Hello(Gtk.Window):
         except OSError:
             return
 
-        self.save["locale"] = use_locale
+        if self.save["locale"] != use_locale:
+            self.save["locale"] = use_locale
+            self._save_dirty = True
 
         # Real-time locale changing
-
-        elts = {
-            "comments": {"aboutdialog"},
-            "label": {
-                "autostartlabel",
-                "development",
-                "chat",
-                "donate",
-                "firstcategory",
-                "forum",
-                "install",
-                "installlabel",
-                "involved",
-                "mailling",
-                "readme",
-                "release",
-                "secondcategory",
-                "thirdcategory",
-                "welcomelabel",
-                "welcometitle",
-                "wiki"
-            },
-            "tooltip_text": {
-                "about",
-                "home",
-                "development",
-                "chat",
-                "donate",
-                "forum",
-                "mailling",
-                "wiki"
-            }
-        }
-        for method in elts:
-            if method not in self.default_texts:
-                self.default_texts[method] = {}
-            for elt in elts[method]:
-                if elt not in self.default_texts[method]:
-                    self.default_texts[method][elt] = getattr(
-                        self.builder.get_object(elt), "get_" + method)()
-                getattr(self.builder.get_object(elt), "set_" + method)(_(self.default_texts[method][elt]))
+        for setter, default_text in self._locale_widgets:
+            setter(_(default_text))
 
         # Change content of pages
         for page in self.pages:
@@ -266,28 +299,47 @@ class Hello(Gtk.Window):
         :param autostart: wanted autostart state
         :type autostart: bool
         """
+        autostart_path = fix_path(self.preferences["autostart_path"])
         try:
-            if autostart and not os.path.isfile(fix_path(self.preferences["autostart_path"])):
-                os.symlink(self.preferences["desktop_path"],
-                           fix_path(self.preferences["autostart_path"]))
-            elif not autostart and os.path.isfile(fix_path(self.preferences["autostart_path"])):
-                os.unlink(fix_path(self.preferences["autostart_path"]))
+            exists = _isfile(_stat_or_none(autostart_path))
+            if autostart and not exists:
+                os.symlink(self.preferences["desktop_path"], autostart_path)
+            elif not autostart and exists:
+                os.unlink(autostart_path)
             # Specific to i3
             i3_config = fix_path("~/.i3/config")
-            if os.path.isfile(i3_config):
+            if _isfile(_stat_or_none(i3_config)):
                 i3_autostart = "exec --no-startup-id " + self.app
-                with open(i3_config, "r+") as file:
+                with open(i3_config, "r") as file:
                     content = file.read()
-                    file.seek(0)
-                    if autostart:
-                        file.write(content.replace("#" + i3_autostart, i3_autostart))
-                    else:
-                        file.write(content.replace(i3_autostart, "#" + i3_autostart))
-                    file.truncate()
+                if autostart:
+                    new_content = content.replace("#" + i3_autostart, i3_autostart)
+                else:
+                    new_content = content.replace(i3_autostart, "#" + i3_autostart)
+                if new_content != content:
+                    with open(i3_config, "w") as file:
+                        file.write(new_content)
             self.autostart = autostart
         except OSError as error:
             print(error)
 
+    def get_page_set(self, use_locale):
+        """List pages available for a language, scanning its directory only once.
+        :param use_locale: locale of pages
+        :type use_locale: str
+        :return: names of pages
+        :rtype: frozenset
+        """
+        if use_locale not in self._page_set_locale:
+            path = "{}pages/{}".format(self.preferences["data_path"], use_locale)
+            try:
+                with os.scandir(path) as entries:
+                    pages = frozenset(entry.name for entry in entries if entry.is_file())
+            except OSError:
+                pages = frozenset()
+            self._page_set_locale[use_locale] = pages
+        return self._page_set_locale[use_locale]
+
     def get_page(self, name):
         """Read page according to language.
         :param name: name of page (filename)
@@ -295,15 +347,19 @@ class Hello(Gtk.Window):
         :return: text to load
         :rtype: str
         """
-        filename = self.preferences["data_path"] + "pages/{}/{}".format(self.save["locale"], name)
-        if not os.path.isfile(filename):
-            filename = self.preferences["data_path"] + \
-                       "pages/{}/{}".format(self.preferences["default_locale"], name)
+        key = (self.save["locale"], name)
+        if key in self._page_cache:
+            return self._page_cache[key]
+        use_locale = self.save["locale"]
+        if use_locale is None or name not in self.get_page_set(use_locale):
+            use_locale = self.preferences["default_locale"]
+        filename = self.preferences["data_path"] + "pages/{}/{}".format(use_locale, name)
         try:
             with open(filename, "r") as fil:
-                return fil.read()
+                self._page_cache[key] = fil.read()
         except OSError:
             return _("Can't load page.")
+        return self._page_cache[key]
 
     # Handlers
     def on_languages_changed(self, combobox):
@@ -314,6 +370,7 @@ class Hello(Gtk.Window):
         """Event for differents actions."""
         name = action.get_name()
         if name == "install":
+            import subprocess
             subprocess.Popen(["calamares_polkit"])
         elif name == "autostart":
             self.set_autostart(action.get_active())
@@ -334,14 +391,54 @@ class Hello(Gtk.Window):
 
     def on_link_clicked(self, link, _=None):
         """Event for clicked link."""
+        import webbrowser
         webbrowser.open_new_tab(self.preferences["urls"][link.get_name()])
 
     def on_delete_window(self, *args):
         """Event to quit app."""
-        write_json(self.preferences["save_path"], self.save)
+        if self._save_dirty:
+            write_json(self.preferences["save_path"], self.save)
         Gtk.main_quit(*args)
 
 
+def _stat_or_none(path):
+    """Stat a path, following symlinks.
+    :param path: path to stat
+    :type path: str
+    :return: stat result, or None if path can't be reached
+    :rtype: os.stat_result
+    """
+    try:
+        return os.stat(path)
+    except (OSError, ValueError):
+        return None
+
+
+def _isfile(st):
+    """Tell if a stat result describes a regular file.
+    :param st: result of _stat_or_none
+    :type st: os.stat_result
+    :rtype: bool
+    """
+    return st is not None and stat.S_ISREG(st.st_mode)
+
+
+@functools.lru_cache(maxsize=None)
+def get_locale_dirs(locale_path):
+    """List subdirectories of locale_path, without stat'ing each of them.
+    :param locale_path: root of locales
+    :type locale_path: str
+    :return: names of locale directories
+    :rtype: frozenset
+    """
+    try:
+        with os.scandir(locale_path) as entries:
+            return frozenset(entry.name for entry in entries if entry.is_dir())
+    except OSError:
+        return frozenset()
+
+
+@functools.lru_cache(maxsize=None)
 def fix_path(path):
     """Make good paths.
     :param path: path to fix
@@ -349,11 +446,33 @@ def fix_path(path):
     :return: fixed path
     :rtype: str
     """
-    if "~" in path:
-        path = path.replace("~", os.path.expanduser("~"))
+    if path.startswith("~"):
+        path = path.replace("~", _HOME, 1)
     return path
 
 
+def load_pixbuf(path, size):
+    """Load an image, downscaled while decoding if it's bigger than size.
+    :param path: path of image
+    :type path: str
+    :param size: max width and height
+    :type size: int
+    :return: image
+    :rtype: GdkPixbuf.Pixbuf
+    """
+    def on_size_prepared(loader, width, height):
+        if max(width, height) > size:
+            ratio = size / max(width, height)
+            loader.set_size(max(1, round(width * ratio)), max(1, round(height * ratio)))
+
+    loader = GdkPixbuf.PixbufLoader()
+    loader.connect("size-prepared", on_size_prepared)
+    with open(path, "rb") as fil:
+        loader.write(fil.read())
+    loader.close()
+    return loader.get_pixbuf()
+
+
 def read_json(path):
     """Read content of a json file.
     :param path: path to read
@@ -363,8 +482,8 @@ def read_json(path):
     """
     path = fix_path(path)
     try:
-        with open(path, "r") as fil:
-            return json.load(fil)
+        with open(path, "rb") as fil:
+            return _loads(fil.read())
     except OSError:
         return None
 
@@ -376,32 +495,45 @@ def write_json(path, content):
     :param content: content to write
     :type path: str
     """
-    path = fix_path(path)
+    # Resolve symlinks so a linked save file is updated, not replaced
+    path = os.path.realpath(fix_path(path))
+    tmp_path = path + ".tmp"
+    data = _dumps(content)
     try:
-        with open(path, "w") as fil:
-            json.dump(content, fil)
+        with open(tmp_path, "wb") as fil:
+            fil.write(data)
+            fil.flush()
+            os.fsync(fil.fileno())
+        os.replace(tmp_path, path)
     except OSError as error:
         print(error)
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
 
 
 def get_lsb_infos():
     """Read informations from the lsb-release file.
     :return: args from lsb-release file
     :rtype: dict"""
-    lsb = {}
+    codename = release = None
     try:
         with open("/etc/lsb-release") as lsb_release:
-            for line in lsb_release:
-                if "=" in line:
-                    var, arg = line.rstrip().split("=")
-                    if not arg:
-                        continue
-                    var = var.replace("DISTRIB_","")
-                    lsb[var] = arg.strip('"')
-    except (OSError, KeyError) as error:
+            data = lsb_release.read()
+    except OSError as error:
         print(error)
         return 'not Manjaro', '0.0'
-    return lsb["CODENAME"], lsb["RELEASE"]
+    for line in data.splitlines():
+        var, _sep, arg = line.partition("=")
+        if var == "DISTRIB_CODENAME":
+            codename = arg.strip().strip('"') or codename
+        elif var == "DISTRIB_RELEASE":
+            release = arg.strip().strip('"') or release
+        if codename and release:
+            return codename, release
+    print("Missing DISTRIB_CODENAME or DISTRIB_RELEASE in /etc/lsb-release")
+    return codename or 'not Manjaro', release or '0.0'
 
 
 if __name__ == "__main__":